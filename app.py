@@ -9,13 +9,21 @@ import request_proxy
 import forms
 from connect import db_uri
 from access_goodreads import get_goodreads_book
+from template_cache import bytecode_cache, FragmentCacheExtension
+from rankings import RANKINGS, ALL_YEARS
 
 db = SQLAlchemy()
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = db_uri()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['JINJA_BYTECODE_CACHE_DIR'] = Path(__file__).parent / '.jinja_cache'
 app.secret_key = Path('flask_secret_key.txt').read_text()
+# compiled templates are kept on disk between runs, and rendered fragments
+# are cached in memory via the {% cache %} tag
+app.jinja_options = dict(app.jinja_options,
+                         bytecode_cache = bytecode_cache(app.config['JINJA_BYTECODE_CACHE_DIR']),
+                         extensions = [FragmentCacheExtension])
 db.init_app(app)
 
 @app.route('/')
@@ -88,8 +96,11 @@ def logout():
 @app.route('/books')
 def show_books():
     '''Show table with info for all books in database'''
+    # the books query is only run when the book table fragment is not already
+    # cached for the current version of the book table
     books = request_proxy.get_all_books(db)
-    return render_template('books.html', books=books)
+    book_version = request_proxy.get_book_version(db)
+    return render_template('books.html', books=books, book_version=book_version)
 
 @app.route('/api/<string:isbn>')
 def get_book_json(isbn):
@@ -112,6 +123,45 @@ def get_book_json(isbn):
         'average_score': goodreads_book['average_rating']
     })
 
+@app.route('/rankings/<string:ranking>')
+@app.route('/rankings/<string:ranking>/<int:year>')
+def show_ranking(ranking, year = None):
+    '''Show table of the top-rated or most-reviewed books, overall or for one publication year'''
+    if ranking not in RANKINGS:
+        return('No ranking with the specified name exists')
+    # ALL_YEARS is how the lists covering all years are stored, not a valid year
+    if year == ALL_YEARS:
+        return('No ranking exists for the specified year')
+    books = request_proxy.get_ranking(ranking, ALL_YEARS if year is None else year, db)
+    return render_template('rankings.html',
+                            books = books,
+                            ranking_name = RANKINGS[ranking]['name'],
+                            year = year)
+
+@app.route('/api/rankings/<string:ranking>')
+@app.route('/api/rankings/<string:ranking>/<int:year>')
+def get_ranking_json(ranking, year = None):
+    '''Provide JSON with the top-rated or most-reviewed books, overall or for one publication year'''
+    if ranking not in RANKINGS:
+        return jsonify({'error': 'There is no ranking with this name'}), 404
+    # ALL_YEARS is how the lists covering all years are stored, not a valid year
+    if year == ALL_YEARS:
+        return jsonify({'error': 'There is no ranking for this year'}), 404
+    books = request_proxy.get_ranking(ranking, ALL_YEARS if year is None else year, db)
+    return jsonify({
+        'ranking': ranking,
+        'year': year,
+        'books': [{
+            'rank': book['position'],
+            'title': book['title'],
+            'authors': book['authors'],
+            'year': book['publication_year'],
+            'isbn': book['isbn'],
+            'review_count': book['review_count'],
+            'average_score': book['average_rating']
+        } for book in books]
+    })
+
 @app.route('/books/<string:isbn>', methods = ['GET', 'POST'])
 def show_book(isbn):
     '''Display info about and provide option to review book with the specified isbn.'''
@@ -121,10 +171,12 @@ def show_book(isbn):
     if not book:
         return('No book with the specified ISBN exists in the database')
 
-    reviews = request_proxy.get_reviews(book['book_id'], db)
+    # the review version changes whenever a review is added, so it is used
+    # to key the cached reviews table fragment
+    review_version = request_proxy.get_review_version(book['book_id'], db)
     # Only show reviews table if reviews exist
     show_reviews = False
-    if reviews:
+    if review_version['review_count']:
         show_reviews = True
 
     goodreads_book = get_goodreads_book(isbn)
@@ -137,26 +189,27 @@ def show_book(isbn):
         if not_reviewed:
             show_form = True
     if request.method == 'POST':
-        request_proxy.add_review(user_id = session['user_id'],
-                                book_id = book['book_id'],
-                                rating = request.form['rating'],
-                                review_text = request.form['review_text'],
-                                db = db)
-        return render_template('review.html',
-                                book = book,
-                                goodreads_num_ratings = goodreads_book['ratings_count'],
-                                goodreads_avg_rating = goodreads_book['average_rating'],
-                                show_form = False,
-                                show_reviews = True,
-                                reviews = request_proxy.get_reviews(book['book_id'], db))
-    else:
-        return render_template('review.html',
-                                book = book,
-                                goodreads_num_ratings = goodreads_book['ratings_count'],
-                                goodreads_avg_rating = goodreads_book['average_rating'],
-                                show_form = show_form,
-                                show_reviews = show_reviews,
-                                reviews = reviews)
+        try:
+            request_proxy.add_review(user_id = session['user_id'],
+                                    book_id = book['book_id'],
+                                    rating = request.form['rating'],
+                                    review_text = request.form['review_text'],
+                                    db = db)
+        except ValueError as e:
+            flash(str(e), 'error')
+        else:
+            review_version = request_proxy.get_review_version(book['book_id'], db)
+            show_form = False
+            show_reviews = True
+    # reviews are only queried when the reviews table fragment is not already cached
+    return render_template('review.html',
+                            book = book,
+                            goodreads_num_ratings = goodreads_book['ratings_count'],
+                            goodreads_avg_rating = goodreads_book['average_rating'],
+                            show_form = show_form,
+                            show_reviews = show_reviews,
+                            review_version = review_version['version'],
+                            get_reviews = lambda: request_proxy.get_reviews(book['book_id'], db))
 
 @app.route('/search', methods = ['GET'])
 def render_search():
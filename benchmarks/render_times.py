@@ -0,0 +1,79 @@
+'''Times template loading and rendering of review.html with and without caching
+
+Renders review.html with a given number of made-up reviews directly through
+Jinja, so no database or goodreads.com access is needed and the figures
+cover template work only.
+
+Usage: python benchmarks/render_times.py [NUMBER_OF_REVIEWS]
+'''
+import sys
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+# add the folder containing template_cache.py to the python path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from template_cache import bytecode_cache, FragmentCacheExtension
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / 'templates'
+
+def make_environment(cache_dir = None):
+    '''Returns a Jinja environment configured like the app's, optionally with a bytecode cache'''
+    return Environment(loader = FileSystemLoader(str(TEMPLATE_DIR)),
+                       autoescape = True,
+                       bytecode_cache = bytecode_cache(cache_dir) if cache_dir else None,
+                       extensions = [FragmentCacheExtension])
+
+def make_context(num_reviews):
+    '''Returns the variables passed to review.html, with num_reviews made-up reviews'''
+    reviews = [{'username': f'user{i}', 'numeric_rating': str(i % 5 + 1), 'review_text': 'x' * 200}
+               for i in range(num_reviews)]
+    book = {'book_id': 1, 'isbn': '0380795272', 'title': 'Krondor: The Betrayal',
+            'publication_year': 1998, 'authors': 'Raymond E. Feist'}
+    return {'book': book,
+            'goodreads_num_ratings': 100,
+            'goodreads_avg_rating': 4.1,
+            'show_form': False,
+            'show_reviews': True,
+            'review_version': f'{num_reviews}-{num_reviews}',
+            'get_reviews': lambda: reviews,
+            # stand-ins for the globals flask adds to templates
+            'session': {},
+            'url_for': lambda *args, **kwargs: '/',
+            'get_flashed_messages': lambda **kwargs: []}
+
+def time_ms(function, repeats):
+    '''Returns the average time of a call to function in milliseconds'''
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def main(num_reviews):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        # fill the bytecode cache, as the first worker to load the template would
+        make_environment(cache_dir).get_template('review.html')
+        print('template load, no bytecode cache:   %.2f ms'
+              % time_ms(lambda: make_environment().get_template('review.html'), 50))
+        print('template load, with bytecode cache: %.2f ms'
+              % time_ms(lambda: make_environment(cache_dir).get_template('review.html'), 50))
+    finally:
+        shutil.rmtree(cache_dir)
+
+    environment = make_environment()
+    template = environment.get_template('review.html')
+    context = make_context(num_reviews)
+    def render_uncached():
+        environment.fragment_cache.clear()
+        template.render(**context)
+    print('render %d reviews, fragment miss: %.2f ms' % (num_reviews, time_ms(render_uncached, 50)))
+    template.render(**context)
+    print('render %d reviews, fragment hit:  %.3f ms'
+          % (num_reviews, time_ms(lambda: template.render(**context), 500)))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,32 @@
+import sys
+from flask import Flask
+from sqlalchemy import text
+
+from models import *
+# add the folder containing connect.py to the python path
+sys.path.append("..")
+from connect import db_uri # pylint disable=import-error
+
+app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = db_uri()
+app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+db.init_app(app)
+
+def add_review_constraint():
+  '''Adds the unique (user_id, book_id) constraint to an existing review table
+
+  Tables created by create_tables.py after the constraint was added to
+  models.py already have it. Any duplicate reviews are removed first,
+  keeping each user's earliest review of a book.
+  '''
+  db.session.execute(text(
+    'DELETE newer FROM review newer JOIN review older '
+    'ON newer.user_id = older.user_id AND newer.book_id = older.book_id '
+    'AND newer.review_id > older.review_id'))
+  db.session.execute(text(
+    'ALTER TABLE review ADD CONSTRAINT unique_user_book_review UNIQUE (user_id, book_id)'))
+  db.session.commit()
+
+if __name__ == "__main__":
+  with app.app_context():
+    add_review_constraint()
@@ -0,0 +1,22 @@
+import sys
+from flask import Flask
+
+from models import *
+# add the folder containing connect.py and rankings.py to the python path
+sys.path.append("..")
+from connect import db_uri # pylint disable=import-error
+from rankings import rebuild_rankings
+
+app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = db_uri()
+app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+db.init_app(app)
+
+def build_rankings():
+  '''Rebuilds the book_rating_stats and book_ranking tables from the review table'''
+  with db.engine.begin() as connection:
+    rebuild_rankings(connection)
+
+if __name__ == "__main__":
+  with app.app_context():
+    build_rankings()
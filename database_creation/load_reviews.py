@@ -0,0 +1,112 @@
+import sys
+import csv
+from flask import Flask
+
+# add the folder containing connect.py to the python path
+sys.path.append("..")
+from connect import db_uri
+from sqlalchemy.exc import DBAPIError
+from review_writes import insert_reviews, validate_review
+from rankings import rebuild_rankings
+from models import *
+
+app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = db_uri()
+app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+db.init_app(app)
+
+def add_reviews(filename, batch_size = 10000):
+    '''Add reviews from a csv file to the database review table.
+
+    Streams the file rather than reading it into memory, inserting the
+    reviews in batches of batch_size rows with one transaction per batch.
+    Reviews by a user who has already reviewed the book (whether earlier in
+    the file or already in the database) are skipped by the unique
+    (user_id, book_id) constraint on the review table, so an interrupted
+    import can simply be rerun. The book rankings are rebuilt once at the
+    end rather than updated with each batch. Rows without exactly four
+    columns, or with a non-numeric user_id, a rating other than 1-5, an
+    over-long review_text, or a user_id that is not in the user table are
+    rejected and counted.
+
+    Assumes each row of the csv has the columns user_id, isbn, numeric_rating,
+    and review_text, with no header row.
+
+    Args:
+        filename (str): The path of the csv file of reviews
+        batch_size (int): The number of reviews to insert per transaction
+
+    Returns:
+        dict: The number of reviews read, inserted, rejected, and skipped
+            because the isbn is not in the book table
+    '''
+    # look up book_ids once up front instead of once per review
+    book_ids = dict(db.session.query(Book.isbn, Book.book_id))
+    counts = {'read': 0, 'inserted': 0, 'rejected': 0, 'unknown_isbn': 0}
+    batch = []
+    with open(filename, newline = '') as reviews:
+        for row in csv.reader(reviews):
+            counts['read'] += 1
+            if len(row) != 4:
+                counts['rejected'] += 1
+                continue
+            user_id, isbn, rating, review_text = row
+            # as in load_book.py, isbns may be missing their leading zeros
+            book_id = book_ids.get(isbn.zfill(10))
+            if book_id is None:
+                counts['unknown_isbn'] += 1
+                continue
+            review = {'user_id': user_id,
+                      'book_id': book_id,
+                      'numeric_rating': rating,
+                      'review_text': review_text}
+            try:
+                review['user_id'] = int(user_id)
+                validate_review(review)
+            except ValueError:
+                counts['rejected'] += 1
+                continue
+            batch.append(review)
+            if len(batch) == batch_size:
+                insert_batch(batch, counts)
+                batch = []
+    insert_batch(batch, counts)
+    with db.engine.begin() as connection:
+        rebuild_rankings(connection)
+    return counts
+
+def insert_batch(batch, counts):
+    '''Insert a batch of reviews into the review table in a single transaction
+
+    If the batch fails (e.g. because one review has an unknown user_id),
+    each of its reviews is inserted in its own transaction instead, so that
+    only the failing reviews are rejected.
+
+    Args:
+        batch (list): A list of review dicts with the keys user_id, book_id,
+            numeric_rating, and review_text
+        counts (dict): The running counts of inserted and rejected reviews,
+            which are updated
+
+    Returns:
+        None
+    '''
+    try:
+        with db.engine.begin() as connection:
+            counts['inserted'] += len(insert_reviews(batch, connection))
+        return
+    except DBAPIError:
+        pass
+    for review in batch:
+        try:
+            with db.engine.begin() as connection:
+                counts['inserted'] += len(insert_reviews([review], connection))
+        except DBAPIError:
+            counts['rejected'] += 1
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: %s REVIEWS_CSV" % sys.argv[0])
+        sys.exit(1)
+    with app.app_context():
+        print(add_reviews(sys.argv[1]))
@@ -35,6 +35,8 @@ class Book_Author(db.Model):
 class Review(db.Model):
   '''Class for the database review table'''
   __tablename__ = 'review'
+  # a user can review a given book only once
+  __table_args__ = (db.UniqueConstraint('user_id', 'book_id', name = 'unique_user_book_review'),)
   review_id = db.Column(db.Integer, nullable = False, index = True, primary_key = True, autoincrement = True)
   user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'))
   book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'))
@@ -42,3 +44,37 @@ class Review(db.Model):
   # db.Column values to a specific set of integers rather than a specific set of db.db.Strings
   numeric_rating = db.Column(db.Enum("1", "2", "3", "4", "5"), nullable = False)
   review_text = db.Column(db.String(250))
+
+class Book_Rating_Stats(db.Model):
+  '''Class for the database book_rating_stats table, which holds the review count
+  and average rating of each reviewed book and is maintained by rankings.py'''
+  __tablename__ = 'book_rating_stats'
+  book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), primary_key = True)
+  # copied from the book table so that per-year rankings don't need a join
+  publication_year = db.Column(db.Integer, nullable = False)
+  review_count = db.Column(db.Integer, nullable = False)
+  rating_sum = db.Column(db.Integer, nullable = False)
+  average_rating = db.Column(db.Float, nullable = False)
+  __table_args__ = (
+    db.Index('ix_book_rating_stats_average_rating', 'average_rating', 'review_count'),
+    db.Index('ix_book_rating_stats_review_count', 'review_count', 'average_rating'),
+    db.Index('ix_book_rating_stats_year_average_rating', 'publication_year', 'average_rating', 'review_count'),
+    db.Index('ix_book_rating_stats_year_review_count', 'publication_year', 'review_count', 'average_rating'),
+  )
+
+class Book_Ranking(db.Model):
+  '''Class for the database book_ranking table, which holds the materialized
+  top-rated and most-reviewed book lists maintained by rankings.py'''
+  __tablename__ = 'book_ranking'
+  # the name of the list, e.g. 'top_rated' or 'most_reviewed'
+  ranking = db.Column(db.String(20), primary_key = True)
+  # the publication year the list covers, or 0 for the list covering all years
+  ranking_year = db.Column(db.Integer, primary_key = True)
+  position = db.Column(db.Integer, primary_key = True)
+  book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable = False)
+  isbn = db.Column(db.String(10), nullable = False)
+  title = db.Column(db.String(250), nullable = False)
+  authors = db.Column(db.String(1000))
+  publication_year = db.Column(db.Integer, nullable = False)
+  review_count = db.Column(db.Integer, nullable = False)
+  average_rating = db.Column(db.Float, nullable = False)
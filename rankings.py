@@ -0,0 +1,258 @@
+import logging
+from collections import defaultdict
+from sqlalchemy import select, insert, delete, func, cast, Integer
+from sqlalchemy.dialects import mysql, sqlite
+
+from database_creation.models import Book, Author, Book_Author, Review, Book_Rating_Stats, Book_Ranking
+
+# the number of books in each list
+RANKING_SIZE = 100
+# books with fewer reviews than this are left out of the top-rated lists
+MIN_REVIEWS_FOR_TOP_RATED = 5
+# the ranking_year used for the lists covering all publication years
+ALL_YEARS = 0
+
+# for each list, the name shown on its page, the minimum review count for a
+# book to be included, and the columns books are ranked by. Every column is
+# sorted descending, including the book_id tiebreaker, so that the order
+# matches a backward scan of the book_rating_stats indexes (InnoDB ends each
+# secondary index with the primary key).
+RANKINGS = {
+    'top_rated': {
+        'name': 'Top Rated',
+        'min_review_count': MIN_REVIEWS_FOR_TOP_RATED,
+        'sort_columns': ('average_rating', 'review_count', 'book_id')
+    },
+    'most_reviewed': {
+        'name': 'Most Reviewed',
+        'min_review_count': 1,
+        'sort_columns': ('review_count', 'average_rating', 'book_id')
+    }
+}
+
+logger = logging.getLogger(__name__)
+
+def select_book_stats(book_ids = None):
+    '''Returns a query aggregating the review table into per-book rating stats
+
+    Args:
+        book_ids (list): The book_ids to aggregate; all reviewed books if None
+
+    Returns:
+        sqlalchemy.sql.Select: A query returning the book_id, publication_year,
+            review_count, rating_sum, and average_rating of each book
+    '''
+    rating = cast(Review.numeric_rating, Integer)
+    stats = select(
+            Review.book_id,
+            Book.publication_year,
+            func.count(Review.review_id),
+            func.sum(rating),
+            func.avg(rating)
+        ).where(Review.book_id == Book.book_id
+        ).group_by(Review.book_id, Book.publication_year)
+    if book_ids is not None:
+        stats = stats.where(Review.book_id.in_(book_ids))
+    return stats
+
+def add_to_book_stats(reviews, connection):
+    '''Adds newly inserted reviews to the book_rating_stats rows of the reviewed books
+
+    Increments review_count and rating_sum of each book in place, with an
+    upsert for books reviewed for the first time, and derives average_rating
+    from the new totals, so no reviews are re-read. Must run in the same
+    transaction as the insert of the reviews, so that the stats can't miss
+    committed reviews or count them again after a concurrent rebuild_rankings.
+
+    Args:
+        reviews (list): The inserted reviews, as rows with book_id and numeric_rating
+        connection: The sqlalchemy connection used to execute the queries
+
+    Returns:
+        None
+    '''
+    if not reviews:
+        return
+    review_counts = defaultdict(int)
+    rating_sums = defaultdict(int)
+    for review in reviews:
+        review_counts[review.book_id] += 1
+        rating_sums[review.book_id] += int(review.numeric_rating)
+    years = dict(connection.execute(select(Book.book_id, Book.publication_year
+        ).where(Book.book_id.in_(list(review_counts)))).all())
+    rows = [{'book_id': book_id,
+             'publication_year': years[book_id],
+             'review_count': review_counts[book_id],
+             'rating_sum': rating_sums[book_id],
+             'average_rating': rating_sums[book_id] / review_counts[book_id]}
+            for book_id in review_counts]
+
+    stats = Book_Rating_Stats.__table__.c
+    if connection.dialect.name == 'sqlite':
+        statement = sqlite.insert(Book_Rating_Stats.__table__)
+        new = statement.excluded
+        # sqlite evaluates every assignment against the existing row
+        statement = statement.on_conflict_do_update(index_elements = ['book_id'], set_ = {
+            'review_count': stats.review_count + new.review_count,
+            'rating_sum': stats.rating_sum + new.rating_sum,
+            'average_rating': (stats.rating_sum + new.rating_sum) * 1.0 / (stats.review_count + new.review_count)
+        })
+    else:
+        statement = mysql.insert(Book_Rating_Stats.__table__)
+        new = statement.inserted
+        # mysql applies the assignments in order, each seeing the ones before it,
+        # so average_rating is computed first from the existing totals
+        statement = statement.on_duplicate_key_update([
+            ('average_rating', (stats.rating_sum + new.rating_sum) / (stats.review_count + new.review_count)),
+            ('review_count', stats.review_count + new.review_count),
+            ('rating_sum', stats.rating_sum + new.rating_sum)
+        ])
+    connection.execute(statement, rows)
+
+def ranking_needs_refresh(ranking, ranking_year, books, connection):
+    '''Returns whether a stored list could change given the new stats of some books
+
+    The list changes only if one of the books is already in it or now ranks
+    above the last book in it (or the list is not yet full).
+
+    Args:
+        ranking (str): A key of RANKINGS
+        ranking_year (int): The publication year the list covers, or ALL_YEARS
+        books (list): The book_rating_stats rows of the newly reviewed books
+            that fall within ranking_year
+        connection: The sqlalchemy connection used to execute the queries
+
+    Returns:
+        bool: True if the list should be refreshed
+    '''
+    sort_columns = RANKINGS[ranking]['sort_columns']
+    listed = connection.execute(select(Book_Ranking
+        ).where(Book_Ranking.ranking == ranking
+        ).where(Book_Ranking.ranking_year == ranking_year
+        ).order_by(Book_Ranking.position)).all()
+    listed_ids = {book.book_id for book in listed}
+    if any(book.book_id in listed_ids for book in books):
+        return True
+    qualifying = [book for book in books
+                  if book.review_count >= RANKINGS[ranking]['min_review_count']]
+    if not qualifying:
+        return False
+    if len(listed) < RANKING_SIZE:
+        return True
+    # every sort column is descending, so a larger tuple ranks higher
+    last_key = tuple(getattr(listed[-1], column) for column in sort_columns)
+    return any(tuple(getattr(book, column) for column in sort_columns) > last_key
+               for book in qualifying)
+
+def refresh_ranking(ranking, ranking_year, connection):
+    '''Replaces the stored list for one ranking and publication year
+
+    Reads the top of book_rating_stats by scanning the index matching the
+    ranking's order backwards (for a top-rated list, skipping books with too
+    few reviews as it goes), then the book and author rows of the books in
+    the list, so the cost doesn't grow with the size of the review table.
+
+    Args:
+        ranking (str): A key of RANKINGS
+        ranking_year (int): The publication year the list covers, or ALL_YEARS
+        connection: The sqlalchemy connection used to execute the queries
+
+    Returns:
+        None
+    '''
+    connection.execute(delete(Book_Ranking
+        ).where(Book_Ranking.ranking == ranking
+        ).where(Book_Ranking.ranking_year == ranking_year))
+
+    top_books = select(Book_Rating_Stats
+        ).where(Book_Rating_Stats.review_count >= RANKINGS[ranking]['min_review_count']
+        ).order_by(*[getattr(Book_Rating_Stats, column).desc()
+                     for column in RANKINGS[ranking]['sort_columns']]
+        ).limit(RANKING_SIZE)
+    if ranking_year != ALL_YEARS:
+        top_books = top_books.where(Book_Rating_Stats.publication_year == ranking_year)
+    top_books = connection.execute(top_books).all()
+    if not top_books:
+        return
+
+    book_ids = [book.book_id for book in top_books]
+    # outer joins so that a book without author rows is still listed
+    book_info = connection.execute(select(
+            Book.book_id,
+            Book.isbn,
+            Book.title,
+            func.group_concat(Author.full_name).label('authors')
+        ).select_from(Book
+        ).outerjoin(Book_Author, Book.book_id == Book_Author.book_id
+        ).outerjoin(Author, Author.author_id == Book_Author.author_id
+        ).where(Book.book_id.in_(book_ids)
+        ).group_by(Book.book_id, Book.isbn, Book.title))
+    book_info = {book.book_id: book for book in book_info}
+
+    rows = []
+    for position, book in enumerate(top_books, start = 1):
+        rows.append({'ranking': ranking,
+                     'ranking_year': ranking_year,
+                     'position': position,
+                     'book_id': book.book_id,
+                     'isbn': book_info[book.book_id].isbn,
+                     'title': book_info[book.book_id].title,
+                     'authors': book_info[book.book_id].authors,
+                     'publication_year': book.publication_year,
+                     'review_count': book.review_count,
+                     'average_rating': book.average_rating})
+    connection.execute(insert(Book_Ranking), rows)
+
+def refresh_rankings(book_ids, engine):
+    '''Refreshes the stored lists affected by new reviews of the specified books
+
+    Called after the reviews, and the stats updated with them by
+    add_to_book_stats, have been committed. Only the lists that the reviewed
+    books are in or now qualify for are refreshed, for all years and for the
+    books' publication years. Failures are logged rather than raised, since a
+    list left stale is corrected by its next refresh.
+
+    Args:
+        book_ids (list): The book_ids of the newly reviewed books
+        engine: The sqlalchemy engine used to connect to the database
+
+    Returns:
+        None
+    '''
+    book_ids = list(set(book_ids))
+    if not book_ids:
+        return
+    try:
+        with engine.begin() as connection:
+            books = connection.execute(select(Book_Rating_Stats
+                ).where(Book_Rating_Stats.book_id.in_(book_ids))).all()
+            years = {book.publication_year for book in books}
+            for ranking in RANKINGS:
+                if ranking_needs_refresh(ranking, ALL_YEARS, books, connection):
+                    refresh_ranking(ranking, ALL_YEARS, connection)
+                for year in years:
+                    books_of_year = [book for book in books if book.publication_year == year]
+                    if ranking_needs_refresh(ranking, year, books_of_year, connection):
+                        refresh_ranking(ranking, year, connection)
+    except Exception:
+        logger.exception('Failed to refresh the book rankings for books %s', book_ids)
+
+def rebuild_rankings(connection):
+    '''Rebuilds the book_rating_stats and book_ranking tables from the whole review table
+
+    Args:
+        connection: The sqlalchemy connection used to execute the queries
+
+    Returns:
+        None
+    '''
+    connection.execute(delete(Book_Rating_Stats))
+    connection.execute(insert(Book_Rating_Stats).from_select(
+        ['book_id', 'publication_year', 'review_count', 'rating_sum', 'average_rating'],
+        select_book_stats()))
+    connection.execute(delete(Book_Ranking))
+    years = connection.execute(select(Book_Rating_Stats.publication_year).distinct()).scalars().all()
+    for ranking in RANKINGS:
+        refresh_ranking(ranking, ALL_YEARS, connection)
+        for year in years:
+            refresh_ranking(ranking, year, connection)
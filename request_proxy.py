@@ -4,9 +4,11 @@ import pandas as pd
 import sys
 from sqlalchemy import Table, Column, insert, MetaData, and_, text, func
 
-from database_creation.models import User, Book, Author, Book_Author, Review
+from database_creation.models import User, Book, Author, Book_Author, Review, Book_Ranking
+from review_writes import ReviewBatcher
 
 engine = connect.sql_connect()
+review_batcher = ReviewBatcher(engine)
 
 def get_dict_list_from_result(result):
     '''Turns a sqlalchemy.util._collections.result object into a list of dicts
@@ -45,6 +47,27 @@ def get_all_books(db):
         Author.first_name, Author.middle_name, Author.last_name)
     return books
 
+def get_book_version(db):
+    '''Returns the version of the book table
+
+    The version changes whenever the book table is reloaded, so it can be
+    used to key cached content that lists all books.
+
+    Args:
+        db: The flask_sqlalchemy.SQLAlchemy object used to
+            interact with the database
+
+    Returns:
+        str: The number of books and the largest book_id, combined
+    '''
+    book_version = db.session.query(
+            func.count(Book.book_id).label('book_count'),
+            func.max(Book.book_id).label('last_book_id')
+        )
+    # the aggregate query always returns exactly one row
+    book_version = get_dict_list_from_result(book_version)[0]
+    return f"{book_version['book_count']}-{book_version['last_book_id']}"
+
 def get_searched_books(param_dict, db):
     '''Returns book(s) that match user search.
     
@@ -187,6 +210,10 @@ def not_yet_reviewed(user_id, book_id, db):
 
 def add_review(user_id, book_id, rating, review_text, db):
     '''If user has not previously reviewed this book, add the user's review to the database
+
+    The review is committed together with any other reviews submitted at the
+    same time; a review by a user who has already reviewed the book is
+    ignored by the database's unique (user_id, book_id) constraint.
     
     Args:
         user_id: The user_id (used as the primary key in the user database table)
@@ -198,17 +225,18 @@ def add_review(user_id, book_id, rating, review_text, db):
 
     Returns:
         None
+
+    Raises:
+        ValueError: If the rating is not one of 1-5 or the review text is too long
+        TimeoutError: If the review is not written in time
     '''
-    # first check if a review by this user exists
-    not_reviewed = not_yet_reviewed(user_id, book_id, db)
-    if not_reviewed:
-        # Add review to database
-        review = Review(user_id = user_id,
-                        book_id = book_id,
-                        numeric_rating = rating,
-                        review_text = review_text)
-        db.session.add(review)
-        db.session.commit()
+    review_batcher.add({'user_id': user_id,
+                        'book_id': book_id,
+                        'numeric_rating': str(rating),
+                        'review_text': review_text})
+    # end the session's current transaction so that later queries in this
+    # request see the newly committed review
+    db.session.commit()
 
 def get_reviews(book_id, db):
     '''Get all user reviews for the given book_id
@@ -230,3 +258,53 @@ def get_reviews(book_id, db):
     if not get_dict_list_from_result(review):
         return None
     return get_dict_list_from_result(review)
+
+def get_review_version(book_id, db):
+    '''Get the review version of the given book_id
+
+    The version changes whenever a review of the book is added, so it can be
+    used to key cached content that depends on the book's reviews.
+
+    Args:
+        book_id: The book_id (used as the primary key in the book database table)
+        db: The flask_sqlalchemy.SQLAlchemy object used to
+            interact with the database
+
+    Returns:
+        dict: A dict with keys review_count (the number of reviews of the book),
+            last_review_id (the review_id of the latest review, or None if
+            there are no reviews), and version (a str combining the two)
+    '''
+    review_version = db.session.query(
+            func.count(Review.review_id).label('review_count'),
+            func.max(Review.review_id).label('last_review_id')
+        ).filter(Review.book_id == book_id)
+    # the aggregate query always returns exactly one row
+    review_version = get_dict_list_from_result(review_version)[0]
+    review_version['version'] = f"{review_version['review_count']}-{review_version['last_review_id']}"
+    return review_version
+
+def get_ranking(ranking, ranking_year, db):
+    '''Get a stored list of top-rated or most-reviewed books
+
+    Reads the materialized list from the book_ranking table, which is kept
+    up to date by rankings.py as reviews are added.
+
+    Args:
+        ranking (str): The name of the list, 'top_rated' or 'most_reviewed'
+        ranking_year (int): The publication year the list covers,
+            or 0 for the list covering all years
+        db: The flask_sqlalchemy.SQLAlchemy object used to
+            interact with the database
+
+    Returns:
+        dict: A list of dictionaries for each book in the list, in rank order,
+            with keys position, isbn, title, authors, publication_year,
+            review_count, and average_rating
+    '''
+    books = Book_Ranking.query.filter_by(ranking = ranking, ranking_year = ranking_year
+        ).order_by(Book_Ranking.position
+        ).with_entities(Book_Ranking.position, Book_Ranking.isbn, Book_Ranking.title,
+        Book_Ranking.authors, Book_Ranking.publication_year, Book_Ranking.review_count,
+        Book_Ranking.average_rating)
+    return get_dict_list_from_result(books)
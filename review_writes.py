@@ -0,0 +1,191 @@
+import queue
+import threading
+import time
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.dialects import mysql, sqlite
+
+from database_creation.models import Review
+from rankings import add_to_book_stats, refresh_rankings
+
+RATINGS = ('1', '2', '3', '4', '5')
+REVIEW_TEXT_LENGTH = Review.__table__.c.review_text.type.length
+
+def validate_review(review):
+    '''Checks that a review can be stored in the review table as it is
+
+    The database would otherwise store an invalid rating as '' or truncate
+    an over-long review_text instead of failing.
+
+    Args:
+        review (dict): A dict with the keys user_id, book_id, numeric_rating,
+            and review_text
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the rating is not one of 1-5 or the review text is too long
+    '''
+    if review['numeric_rating'] not in RATINGS:
+        raise ValueError(f"Rating must be one of {', '.join(RATINGS)}")
+    if review['review_text'] is not None and len(review['review_text']) > REVIEW_TEXT_LENGTH:
+        raise ValueError(f'Review text must be at most {REVIEW_TEXT_LENGTH} characters')
+
+def insert_reviews(reviews, connection):
+    '''Inserts reviews into the review table, skipping duplicates
+
+    Relies on the unique (user_id, book_id) constraint on the review table:
+    a review by a user who has already reviewed the book is ignored by the
+    database rather than checked for beforehand. Any other error, such as an
+    unknown user_id, is raised. Reviews should be checked with validate_review
+    first.
+
+    Args:
+        reviews (list): A list of dicts with the keys user_id, book_id,
+            numeric_rating, and review_text
+        connection: The sqlalchemy connection used to execute the insert;
+            the caller is responsible for committing
+
+    Returns:
+        list: The reviews actually inserted, as rows with book_id and numeric_rating
+    '''
+    if not reviews:
+        return []
+    # in the transaction's snapshot, reviews with a larger review_id than this
+    # that match the batch's (user_id, book_id) pairs can only be the ones
+    # inserted below
+    last_review_id = connection.execute(select(func.max(Review.review_id))).scalar() or 0
+    # only duplicate keys are skipped: the no-op update leaves the existing review as it is
+    if connection.dialect.name == 'sqlite':
+        statement = sqlite.insert(Review.__table__).on_conflict_do_nothing()
+    else:
+        statement = mysql.insert(Review.__table__)
+        statement = statement.on_duplicate_key_update(review_id = statement.table.c.review_id)
+    connection.execute(statement, reviews)
+    pairs = [(review['user_id'], review['book_id']) for review in reviews]
+    inserted = connection.execute(select(Review.book_id, Review.numeric_rating
+        ).where(Review.review_id > last_review_id
+        ).where(tuple_(Review.user_id, Review.book_id).in_(pairs)))
+    return inserted.all()
+
+class ReviewBatcher:
+    '''Class for grouping reviews submitted by concurrent requests into shared transactions
+
+    Each call to add blocks until its review has been committed. A
+    background thread collects the reviews queued while the previous
+    transaction was in progress (waiting at most max_wait seconds for more
+    to arrive, and taking at most max_batch_size) and commits them together
+    with the updated book rating stats. A second thread then refreshes the
+    affected rankings, so the next batch doesn't wait behind the refresh.
+    '''
+    def __init__(self, engine, max_batch_size = 500, max_wait = 0.005, timeout = 30):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.pending = queue.Queue()
+        # book_ids whose rankings need refreshing
+        self.pending_refresh = queue.Queue()
+        self.thread = None
+        self.refresh_thread = None
+        self.thread_lock = threading.Lock()
+
+    def add(self, review):
+        '''Queues a review and waits until the transaction containing it is committed
+
+        Args:
+            review (dict): A dict with the keys user_id, book_id, numeric_rating,
+                and review_text
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If the review fails validate_review
+            TimeoutError: If the review is not written within timeout seconds;
+                it may still be committed later
+        '''
+        validate_review(review)
+        self._start()
+        submission = {'review': review, 'done': threading.Event(), 'error': None}
+        self.pending.put(submission)
+        if not submission['done'].wait(self.timeout):
+            raise TimeoutError(f'Review was not written within {self.timeout} seconds')
+        if submission['error'] is not None:
+            raise submission['error']
+
+    def _start(self):
+        '''Starts the background writer and ranking refresh threads if they are not already running'''
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target = self._run, daemon = True)
+                self.thread.start()
+                self.refresh_thread = threading.Thread(target = self._run_refresh, daemon = True)
+                self.refresh_thread.start()
+
+    def _run(self):
+        '''Repeatedly collects a batch of queued reviews and writes it'''
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self.pending.get(timeout = max(remaining, 0)))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _run_refresh(self):
+        '''Repeatedly refreshes the rankings of all books reviewed since the last refresh'''
+        while True:
+            book_ids = set(self.pending_refresh.get())
+            num_batches = 1
+            # batches written during the previous refresh are handled together
+            while True:
+                try:
+                    book_ids.update(self.pending_refresh.get_nowait())
+                    num_batches += 1
+                except queue.Empty:
+                    break
+            refresh_rankings(list(book_ids), self.engine)
+            for _ in range(num_batches):
+                self.pending_refresh.task_done()
+
+    def wait_for_refresh(self):
+        '''Blocks until the rankings of all reviews written so far have been refreshed'''
+        self.pending_refresh.join()
+
+    def _write(self, batch):
+        '''Inserts the reviews in batch in one transaction and notifies the waiting callers
+
+        If the transaction fails, each review is retried in its own transaction,
+        so that an error is only raised to the caller whose review caused it
+        and a transient error (e.g. a deadlock) gets a second attempt.
+        '''
+        inserted = []
+        try:
+            inserted = self._insert([submission['review'] for submission in batch])
+        except Exception:
+            for submission in batch:
+                try:
+                    inserted += self._insert([submission['review']])
+                except Exception as e:
+                    submission['error'] = e
+        for submission in batch:
+            submission['done'].set()
+        # the lists are refreshed after the reviews are committed, so that a
+        # failure there doesn't lose the reviews or fail their callers
+        if inserted:
+            self.pending_refresh.put([review.book_id for review in inserted])
+
+    def _insert(self, reviews):
+        '''Inserts reviews and adds them to the book rating stats in one transaction
+
+        Returns:
+            list: The reviews actually inserted, as rows with book_id and numeric_rating
+        '''
+        with self.engine.begin() as connection:
+            inserted = insert_reviews(reviews, connection)
+            add_to_book_stats(inserted, connection)
+            return inserted
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+def bytecode_cache(directory):
+    '''Returns a Jinja bytecode cache that persists compiled templates on disk
+
+    Compiled templates are written to the specified directory, so that
+    workers started later can load them instead of recompiling the
+    template source.
+
+    Args:
+        directory (str): The folder in which to store the compiled templates;
+            created if it does not already exist
+
+    Returns:
+        jinja2.FileSystemBytecodeCache: The bytecode cache
+    '''
+    Path(directory).mkdir(parents = True, exist_ok = True)
+    return FileSystemBytecodeCache(str(directory))
+
+class FragmentCache:
+    '''Class for an in-memory store of rendered template fragments
+
+    Holds at most max_entries fragments, discarding the least recently
+    used fragment when full. Keys are expected to contain a version (e.g.
+    the review version of a book), so a stale fragment is never looked up
+    again once the version changes and eventually falls out of the cache.
+
+    The cache is shared by all the threads serving requests, so each
+    method holds a lock while it reads or reorders the stored fragments.
+    '''
+    def __init__(self, max_entries = 1000):
+        self.max_entries = max_entries
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''Returns the fragment stored under key, or None if there is none'''
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+            return fragment
+
+    def set(self, key, fragment):
+        '''Stores the fragment under key'''
+        with self.lock:
+            self.fragments[key] = fragment
+            self.fragments.move_to_end(key)
+            if len(self.fragments) > self.max_entries:
+                self.fragments.popitem(last = False)
+
+    def clear(self):
+        '''Removes all stored fragments'''
+        with self.lock:
+            self.fragments.clear()
+
+class FragmentCacheExtension(Extension):
+    '''Jinja extension adding a {% cache %} tag for caching template fragments
+
+    The body of the tag is rendered once and stored in environment.fragment_cache
+    under a key built from the tag's arguments, e.g.
+
+        {% cache 'reviews', book.book_id, review_version %}
+          ...
+        {% endcache %}
+
+    Later renders with the same arguments reuse the stored output.
+    '''
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache = FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # the tag arguments are gathered into a list that forms the cache key
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle = True)
+        return nodes.CallBlock(self.call_method('_cache_support', [nodes.List(args)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, key_parts, caller):
+        '''Returns the cached fragment for key_parts, rendering and storing it if absent'''
+        key = '/'.join(str(part) for part in key_parts)
+        fragment = self.environment.fragment_cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            self.environment.fragment_cache.set(key, fragment)
+        return fragment
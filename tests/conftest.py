@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, event, insert
+
+# add the folder containing review_writes.py and rankings.py to the python path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from database_creation.models import db, User, Book, Author, Book_Author
+
+NUM_BOOKS = 60
+NUM_USERS = 80
+
+@pytest.fixture
+def engine(tmp_path):
+    '''Returns an engine for a SQLite database with the app's tables, books, and users
+
+    Books are spread over four publication years, and every seventh book has
+    no author rows.
+    '''
+    engine = create_engine(f'sqlite:///{tmp_path / "test.db"}',
+                           connect_args = {'check_same_thread': False, 'timeout': 30})
+    event.listen(engine, 'connect',
+                 lambda connection, record: connection.execute('PRAGMA foreign_keys = ON'))
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for user_id in range(1, NUM_USERS + 1):
+            connection.execute(insert(User).values(user_id = user_id, username = f'user{user_id}',
+                                                   password = 'password'))
+        for book_id in range(1, NUM_BOOKS + 1):
+            connection.execute(insert(Book).values(book_id = book_id, isbn = str(book_id).zfill(10),
+                                                   title = f'Book {book_id}',
+                                                   publication_year = 1990 + book_id % 4))
+            if book_id % 7:
+                connection.execute(insert(Author).values(author_id = book_id, first_name = 'Author',
+                                                         full_name = f'Author {book_id}'))
+                connection.execute(insert(Book_Author).values(book_id = book_id, author_id = book_id))
+    yield engine
+    engine.dispose()
+
+def make_review(user_id, book_id, rating = '3', review_text = 'A review'):
+    '''Returns a review dict as passed to insert_reviews and ReviewBatcher.add'''
+    return {'user_id': user_id, 'book_id': book_id, 'numeric_rating': rating,
+            'review_text': review_text}
@@ -0,0 +1,111 @@
+import random
+import threading
+
+import pytest
+from sqlalchemy import select
+
+from conftest import NUM_BOOKS, NUM_USERS, make_review
+from database_creation.models import Book_Ranking, Book_Rating_Stats
+from review_writes import ReviewBatcher
+import rankings
+
+@pytest.fixture
+def small_rankings(monkeypatch):
+    '''Shortens the lists so that they fill up and books move in and out of them'''
+    monkeypatch.setattr(rankings, 'RANKING_SIZE', 5)
+    monkeypatch.setitem(rankings.RANKINGS['top_rated'], 'min_review_count', 3)
+
+def stored_stats(engine):
+    '''Returns the book_rating_stats rows, with average_rating rounded'''
+    with engine.connect() as connection:
+        stats = connection.execute(select(Book_Rating_Stats).order_by(Book_Rating_Stats.book_id)).all()
+    return [(book.book_id, book.publication_year, book.review_count, book.rating_sum,
+             round(book.average_rating, 9)) for book in stats]
+
+def stored_rankings(engine):
+    '''Returns the book_ranking rows, with average_rating rounded'''
+    with engine.connect() as connection:
+        ranked = connection.execute(select(Book_Ranking).order_by(
+            Book_Ranking.ranking, Book_Ranking.ranking_year, Book_Ranking.position)).all()
+    return [(book.ranking, book.ranking_year, book.position, book.book_id, book.authors,
+             book.review_count, round(book.average_rating, 9)) for book in ranked]
+
+def rebuild(engine):
+    with engine.begin() as connection:
+        rankings.rebuild_rankings(connection)
+
+def write_random_reviews(batcher, num_reviews, num_threads, seed):
+    '''Adds num_reviews random reviews (including duplicates) from num_threads threads'''
+    generator = random.Random(seed)
+    reviews = [make_review(generator.randint(1, NUM_USERS), generator.randint(1, NUM_BOOKS),
+                           str(generator.randint(1, 5)))
+               for _ in range(num_reviews)]
+    threads = [threading.Thread(target = lambda part: [batcher.add(review) for review in part],
+                                args = (reviews[i::num_threads],))
+               for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.wait_for_refresh()
+
+@pytest.mark.parametrize('num_threads', [1, 8])
+def test_incremental_rankings_match_rebuild(engine, small_rankings, num_threads):
+    batcher = ReviewBatcher(engine)
+    write_random_reviews(batcher, 1000, num_threads, seed = num_threads)
+    incremental = stored_stats(engine), stored_rankings(engine)
+    assert incremental[1]
+
+    rebuild(engine)
+    assert (stored_stats(engine), stored_rankings(engine)) == incremental
+
+def test_rankings_order_and_minimum_review_count(engine, small_rankings):
+    batcher = ReviewBatcher(engine)
+    write_random_reviews(batcher, 600, 4, seed = 0)
+    ranked = stored_rankings(engine)
+    stats = {book[0]: book for book in stored_stats(engine)}
+
+    top_rated = [book for book in ranked if book[0] == 'top_rated' and book[1] == rankings.ALL_YEARS]
+    assert len(top_rated) == 5
+    assert all(book[5] >= 3 for book in top_rated)
+    keys = [(book[6], book[5], book[3]) for book in top_rated]
+    assert keys == sorted(keys, reverse = True)
+    # no unlisted book with enough reviews outranks the last listed one
+    listed = {book[3] for book in top_rated}
+    assert all((book[4], book[2], book[0]) < keys[-1] for book in stats.values()
+               if book[0] not in listed and book[2] >= 3)
+
+    for year in range(1990, 1994):
+        most_reviewed = [book for book in ranked if book[0] == 'most_reviewed' and book[1] == year]
+        assert most_reviewed
+        assert all(stats[book[3]][1] == year for book in most_reviewed)
+
+def test_book_without_authors_is_listed(engine):
+    # book 7 has no author rows
+    batcher = ReviewBatcher(engine)
+    batcher.add(make_review(1, 7, '5'))
+    batcher.wait_for_refresh()
+    ranked = stored_rankings(engine)
+    assert ('most_reviewed', rankings.ALL_YEARS, 1, 7, None, 1, 5.0) in ranked
+
+def test_unaffected_lists_are_not_refreshed(engine, small_rankings, monkeypatch):
+    batcher = ReviewBatcher(engine)
+    # fill the all-years most-reviewed list with books that have four reviews
+    for book_id in range(1, 6):
+        for user_id in range(1, 5):
+            batcher.add(make_review(user_id, book_id))
+    batcher.wait_for_refresh()
+
+    refreshed = []
+    refresh_ranking = rankings.refresh_ranking
+    def record_refresh(ranking, ranking_year, connection):
+        refreshed.append((ranking, ranking_year))
+        refresh_ranking(ranking, ranking_year, connection)
+    monkeypatch.setattr(rankings, 'refresh_ranking', record_refresh)
+
+    # a first review of another book can't enter the full list
+    batcher.add(make_review(1, 10))
+    batcher.wait_for_refresh()
+    assert ('most_reviewed', rankings.ALL_YEARS) not in refreshed
+    # its year's list isn't full, so that one is refreshed
+    assert ('most_reviewed', 1992) in refreshed
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+from sqlalchemy import select
+
+from conftest import make_review
+from database_creation.models import Review
+from review_writes import ReviewBatcher, insert_reviews, validate_review
+
+def stored_reviews(engine):
+    '''Returns the (user_id, book_id, numeric_rating) of every stored review'''
+    with engine.connect() as connection:
+        return connection.execute(select(Review.user_id, Review.book_id, Review.numeric_rating
+            ).order_by(Review.user_id, Review.book_id)).all()
+
+def test_insert_reviews_skips_duplicates(engine):
+    with engine.begin() as connection:
+        inserted = insert_reviews([make_review(1, 1, '3'), make_review(2, 1, '5')], connection)
+    assert sorted(inserted) == [(1, '3'), (1, '5')]
+
+    # a repeated (user_id, book_id) pair, whether already stored or repeated
+    # within the batch, is skipped and the first review is kept
+    with engine.begin() as connection:
+        inserted = insert_reviews([make_review(1, 1, '1'), make_review(3, 2, '4'),
+                                   make_review(3, 2, '2')], connection)
+    assert inserted == [(2, '4')]
+    assert stored_reviews(engine) == [(1, 1, '3'), (2, 1, '5'), (3, 2, '4')]
+
+def test_insert_reviews_raises_other_errors(engine):
+    # an unknown user_id fails the foreign key rather than being skipped
+    with pytest.raises(Exception):
+        with engine.begin() as connection:
+            insert_reviews([make_review(1, 1), make_review(999, 1)], connection)
+    assert stored_reviews(engine) == []
+
+@pytest.mark.parametrize('review', [
+    make_review(1, 1, rating = '0'),
+    make_review(1, 1, rating = ''),
+    make_review(1, 1, rating = 3),
+    make_review(1, 1, review_text = 'x' * 251),
+])
+def test_validate_review_rejects_invalid_reviews(review):
+    with pytest.raises(ValueError):
+        validate_review(review)
+
+def test_validate_review_accepts_valid_review():
+    validate_review(make_review(1, 1, rating = '5', review_text = 'x' * 250))
+
+def test_batcher_groups_concurrent_reviews(engine):
+    batcher = ReviewBatcher(engine, max_wait = 0.05)
+    threads = [threading.Thread(target = batcher.add, args = (make_review(user_id, 1),))
+               for user_id in range(1, 51)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stored_reviews(engine)) == 50
+
+def test_failed_batch_is_retried_one_review_at_a_time(engine):
+    # a long max_wait puts all four reviews in one batch, which the unknown
+    # user_id fails
+    batcher = ReviewBatcher(engine, max_wait = 0.5)
+    errors = {}
+    def add(user_id):
+        try:
+            batcher.add(make_review(user_id, 1))
+        except Exception as e:
+            errors[user_id] = e
+    threads = [threading.Thread(target = add, args = (user_id,)) for user_id in (1, 2, 999, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert list(errors) == [999]
+    assert stored_reviews(engine) == [(1, 1, '3'), (2, 1, '3'), (3, 1, '3')]
+
+def test_batcher_rejects_invalid_review_without_queueing(engine):
+    batcher = ReviewBatcher(engine)
+    with pytest.raises(ValueError):
+        batcher.add(make_review(1, 1, rating = '6'))
+    assert batcher.thread is None
+
+def test_batcher_add_times_out_when_writer_stalls(engine, monkeypatch):
+    batcher = ReviewBatcher(engine, timeout = 0.1)
+    release = threading.Event()
+    monkeypatch.setattr(batcher, '_write', lambda batch: release.wait())
+    with pytest.raises(TimeoutError):
+        batcher.add(make_review(1, 1))
+    release.set()